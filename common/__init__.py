@@ -0,0 +1,14 @@
+from typing import Optional
+
+import orjson
+
+
+def parse_classification(raw: Optional[str]) -> object:
+    # Classifier payloads arrive as JSON text; anything that does not parse is kept
+    # as the raw label string.
+    if not raw:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return raw
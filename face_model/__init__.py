@@ -1,16 +1,26 @@
-from collections import Counter
-from functools import lru_cache
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Iterable, List, Literal, Optional, Sequence, Tuple
+from threading import Lock
+from typing import BinaryIO, Dict, Iterable, List, Literal, Optional, Sequence, Tuple, Union
+import ctypes
+import hashlib
 import io
+import json
+import math
+import os
 import pickle
 import re
 import shutil
 import sys
 import time
 import uuid
+import warnings
 
 import face_recognition
+import numpy as np
 from PIL import Image, ImageDraw
 
 try:
@@ -18,13 +28,53 @@ try:
 except ImportError:  # pragma: no cover - optional dependency
     dlib = None
 
+try:
+    import simsimd  # type: ignore[import]
+except ImportError:  # pragma: no cover - optional dependency
+    simsimd = None
+
+try:
+    import numba  # type: ignore[import]
+except ImportError:  # pragma: no cover - optional dependency
+    numba = None
+
+if sys.platform == "win32":  # pragma: no cover - platform specific
+    import msvcrt
+
+    fcntl = None
+else:
+    import fcntl
+
+if dlib is not None and not getattr(dlib, "USE_AVX_INSTRUCTIONS", True):
+    warnings.warn(
+        "dlib was built without AVX instructions; face encoding will be several times "
+        "slower. Rebuild it from source with USE_AVX_INSTRUCTIONS=1 "
+        "(see face_model/requirements-build.txt).",
+        RuntimeWarning,
+        stacklevel=2,
+    )
+
 MODULE_ROOT = Path(__file__).resolve().parent
-DEFAULT_ENCODINGS_PATH = MODULE_ROOT / "output" / "encodings.pkl"
+DEFAULT_ENCODINGS_PATH = MODULE_ROOT / "output" / "encodings.npy"
 TRAINING_DIR = MODULE_ROOT / "training"
 VALIDATION_DIR = MODULE_ROOT / "validation"
 OUTPUT_DIR = MODULE_ROOT / "output"
 BOUNDING_BOX_COLOR = "blue"
 TEXT_COLOR = "white"
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+PROBE_CACHE_SIZE = 256
+DIGEST_CHUNK_SIZE = 64 * 1024
+DETECTION_MAX_SIDE = 640
+# Reads retried while a concurrent encode is between its two file swaps.
+ENCODINGS_LOAD_ATTEMPTS = 5
+QUANTIZED_MIN_ROWS = 4096
+ENCODE_CHUNK_SIZE = 4
+# Below this many images, pool startup costs more than encoding in-process.
+PARALLEL_ENCODE_MIN_FILES = 32
+
+# Probe encodings keyed by payload digest, so resubmitted frames skip detection.
+_PROBE_CACHE: "OrderedDict[Tuple[bytes, str, str], Tuple[list, np.ndarray]]" = OrderedDict()
+_PROBE_CACHE_LOCK = Lock()
 
 TRAINING_DIR.mkdir(parents=True, exist_ok=True)
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -37,14 +87,12 @@ def _iter_image_files(directory: Path) -> Iterable[Path]:
 
 
 def slugify_name(first_name: str, last_name: str, email: Optional[str] = None) -> str:
-    base_parts = [first_name or "", last_name or ""]
-    base = "-".join(filter(None, base_parts)).lower()
-    base = re.sub(r"[^a-z0-9]+", "-", base).strip("-")
+    base = f"{first_name or ''}-{last_name or ''}".lower()
+    base = _SLUG_RE.sub("-", base).strip("-")
 
     suffix = ""
     if email:
-        local_part = email.split("@", maxsplit=1)[0].lower()
-        suffix = re.sub(r"[^a-z0-9]+", "", local_part)
+        suffix = _SLUG_RE.sub("", email.split("@", maxsplit=1)[0].lower())
 
     if suffix:
         slug = f"{base}-{suffix}" if base else suffix
@@ -64,42 +112,181 @@ def _prepare_training_dir(person_slug: str, replace: bool = True) -> Path:
 
 def store_face_samples(
     person_slug: str,
-    samples: Sequence[bytes],
+    samples: Sequence[Union[bytes, BinaryIO]],
     replace: bool = True,
 ) -> List[Path]:
     target_dir = _prepare_training_dir(person_slug, replace=replace)
     saved_paths: List[Path] = []
-    timestamp = int(time.time() * 1000)
+    timestamp = time.time_ns() // 1_000_000
 
     for index, sample in enumerate(samples, start=1):
         filename = f"{timestamp}_{index:02d}.jpg"
         destination = target_dir / filename
-        destination.write_bytes(sample)
+        if isinstance(sample, (bytes, bytearray, memoryview)):
+            destination.write_bytes(sample)
+        else:
+            # File-like samples are copied in chunks from their current position.
+            with destination.open("wb") as handle:
+                shutil.copyfileobj(sample, handle)
         saved_paths.append(destination)
 
     return saved_paths
 
 
+def _names_path(encodings_location: Path) -> Path:
+    return encodings_location.with_suffix(".names.json")
+
+
+@contextmanager
+def _exclusive_file_lock(lock_path: Path):
+    # Advisory cross-process lock; the OS releases it if the holder dies.
+    with lock_path.open("a+b") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        else:
+            handle.seek(0)
+            while True:
+                try:
+                    # LK_LOCK retries for about ten seconds before raising.
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _file_identity(path: Path) -> List[int]:
+    stat = path.stat()
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
 @lru_cache(maxsize=1)
-def _load_cached_encodings(encodings_path: str):
+def _load_cached_encodings(encodings_path: str, version: Tuple[int, ...]):
+    # ``version`` holds the source files' mtimes so a rewritten encodings file is
+    # picked up on the next lookup without callers clearing the cache per request.
     path = Path(encodings_path)
-    with path.open("rb") as handle:
-        return pickle.load(handle)
+    if path.suffix == ".npy":
+        # Copy-on-write mapping: pages come from the shared OS page cache, so RSS does
+        # not grow with the enrolment set across uvicorn workers. Windows cannot
+        # replace a file another process has mapped, so it reads the matrix eagerly.
+        mmap_mode = None if sys.platform == "win32" else "c"
+        names_path = _names_path(path)
+        for attempt in range(ENCODINGS_LOAD_ATTEMPTS):
+            # The sidecar names the matrix file it was written for; a pair caught
+            # mid-swap by a concurrent encode is retried rather than mislabelled.
+            before = _file_identity(path)
+            sidecar = json.loads(names_path.read_text(encoding="utf-8"))
+            encodings = np.asarray(np.load(path, mmap_mode=mmap_mode))
+            if isinstance(sidecar, dict) and sidecar.get("matrix") == before == _file_identity(path):
+                break
+            time.sleep(0.05 * (attempt + 1))
+        else:
+            raise ValueError(f"Encodings at {path} and their names sidecar are out of sync.")
+        names = np.asarray(sidecar["names"])
+        if len(names) != len(encodings):
+            raise ValueError(f"Encodings at {path} and their names sidecar are out of sync.")
+    else:
+        with path.open("rb") as handle:
+            loaded = pickle.load(handle)
+        # Older pickles hold lists of float64 arrays; normalise to one contiguous matrix.
+        encodings = np.ascontiguousarray(loaded["encodings"], dtype=np.float32)
+        names = np.asarray(loaded["names"])
+
+    cached = {
+        "names": names,
+        "name_to_indices": _index_names(names),
+        "encodings": encodings,
+        "half_norms": 0.5 * np.einsum("ij,ij->i", encodings, encodings),
+    }
+    cached["norms"] = np.sqrt(2.0 * cached["half_norms"])
+    if simsimd is not None and len(encodings) >= QUANTIZED_MIN_ROWS:
+        cached["encodings_q"], cached["q_scale"] = _quantize_encodings(encodings)
+    return cached
+
+
+def _index_names(names: np.ndarray) -> Dict[str, np.ndarray]:
+    # Row indices per person, grouped once so per-query lookups are a single gather.
+    unique_names, inverse = np.unique(names, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    boundaries = np.cumsum(np.bincount(inverse, minlength=len(unique_names)))[:-1]
+    return dict(zip(unique_names.tolist(), np.split(order, boundaries)))
+
+
+def _quantize_encodings(encodings: np.ndarray) -> Tuple[np.ndarray, float]:
+    # One symmetric scale for the whole matrix keeps int8 distances proportional to
+    # float distances, which is what makes the prefilter bound below hold.
+    peak = float(np.abs(encodings).max())
+    scale = peak / 127.0 if peak else 1.0
+    return np.round(encodings / scale).astype(np.int8), scale
 
 
 def load_encodings(encodings_location: Path = DEFAULT_ENCODINGS_PATH):
-    location = Path(encodings_location)
-    if not location.exists():
-        raise FileNotFoundError(
-            f"Encodings file not found at {location}. Run encode_known_faces first."
-        )
-    return _load_cached_encodings(str(location.resolve()))
+    # The matrix is always stored as .npy, whichever suffix the caller passes.
+    location = Path(encodings_location).with_suffix(".npy")
+    try:
+        version = (location.stat().st_mtime_ns, _names_path(location).stat().st_mtime_ns)
+    except FileNotFoundError:
+        # Fall back to an encodings.pkl written before the .npy layout.
+        location = location.with_suffix(".pkl")
+        try:
+            version = (location.stat().st_mtime_ns,)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Encodings file not found at {encodings_location}. Run encode_known_faces first."
+            ) from None
+    return _load_cached_encodings(str(location.resolve()), version)
 
 
 def clear_encodings_cache() -> None:
     _load_cached_encodings.cache_clear()
 
 
+def _write_encodings(encodings_location: Path, names: List[str], matrix: np.ndarray) -> None:
+    # Write to temporaries and swap them in so readers never map a half-written file.
+    # The matrix goes first and the sidecar, which records the matrix file's identity,
+    # last; rename keeps inode and mtime, so the loader can tell whether it paired
+    # the names with the matrix they were written for.
+    matrix_tmp = encodings_location.with_name(encodings_location.name + ".tmp")
+    with matrix_tmp.open("wb") as handle:
+        np.save(handle, matrix)
+    names_path = _names_path(encodings_location)
+    names_tmp = names_path.with_name(names_path.name + ".tmp")
+    names_tmp.write_text(
+        json.dumps({"matrix": _file_identity(matrix_tmp), "names": names}), encoding="utf-8"
+    )
+    os.replace(matrix_tmp, encodings_location)
+    os.replace(names_tmp, names_path)
+
+
+def _encode_training_image(
+    filepath: Path,
+    detector_model: str,
+    encoding_model: str,
+    num_jitters: int,
+) -> Tuple[str, List[np.ndarray]]:
+    image = face_recognition.load_image_file(filepath)
+
+    face_locations = face_recognition.face_locations(image, model=detector_model)
+    if not face_locations:
+        return filepath.parent.name, []
+
+    face_encodings = face_recognition.face_encodings(
+        image,
+        known_face_locations=face_locations,
+        num_jitters=num_jitters,
+        model=encoding_model,
+    )
+    return filepath.parent.name, list(face_encodings)
+
+
 def encode_known_faces(
     mode: Literal["cpu", "gpu"] = "cpu",
     detector_model: Optional[str] = None,
@@ -107,6 +294,8 @@ def encode_known_faces(
     num_jitters: Optional[int] = None,
     encoding_model: Optional[str] = None,
     verbose: bool = True,
+    workers: Optional[int] = None,
+    people: Optional[Sequence[str]] = None,
 ) -> None:
     if mode not in {"cpu", "gpu"}:
         raise ValueError("mode must be either 'cpu' or 'gpu'")
@@ -118,8 +307,13 @@ def encode_known_faces(
     )
 
     effective_mode = "gpu" if use_cuda else "cpu"
-    if mode == "gpu" and not use_cuda and verbose:
-        print("CUDA support not detected; falling back to CPU pipeline.")
+    if mode == "gpu" and not use_cuda:
+        warnings.warn(
+            "GPU encoding requested but dlib has no CUDA support; falling back to the "
+            "CPU pipeline.",
+            RuntimeWarning,
+            stacklevel=2,
+        )
 
     if effective_mode == "gpu":
         detector_model = detector_model or "cnn"
@@ -131,83 +325,279 @@ def encode_known_faces(
         num_jitters = num_jitters if num_jitters is not None else 1
 
     names: List[str] = []
-    encodings: List[List[float]] = []
-
-    training_files = list(_iter_image_files(TRAINING_DIR))
+    encodings: List[np.ndarray] = []
+
+    location = Path(encodings_location).with_suffix(".npy")
+    training_files: List[Path] = []
+    # With ``people`` given, only their folders are re-encoded and merged with everyone
+    # else's stored rows, so enrolling one user does not re-process the whole dataset.
+    if people:
+        try:
+            load_encodings(location)
+        except FileNotFoundError:
+            people = None
+        else:
+            for person in people:
+                training_files.extend(_iter_image_files(TRAINING_DIR / person))
+    if not people:
+        training_files = list(_iter_image_files(TRAINING_DIR))
     total_files = len(training_files)
 
-    for index, filepath in enumerate(training_files, start=1):
-        name = filepath.parent.name
-        image = face_recognition.load_image_file(filepath)
+    encode_one = partial(
+        _encode_training_image,
+        detector_model=detector_model,
+        encoding_model=encoding_model,
+        num_jitters=num_jitters,
+    )
 
-        face_locations = face_recognition.face_locations(image, model=detector_model)
-        if not face_locations:
-            continue
+    def _collect(results: Iterable[Tuple[str, List[np.ndarray]]]) -> None:
+        for index, (name, face_encodings) in enumerate(results, start=1):
+            for encoding in face_encodings:
+                names.append(name)
+                encodings.append(encoding)
+
+            if verbose:
+                processed = len(encodings)
+                sys.stdout.write(
+                    f"Encoding {index}/{total_files} files | {processed} embeddings collected\r"
+                )
+                sys.stdout.flush()
+
+    # Images are independent, so the CPU pipeline fans out across processes. Each
+    # spawned worker reloads the dlib models, so small batches such as a single
+    # enrolment stay in-process, and the pool never outnumbers the chunks it gets.
+    # CNN/CUDA mode stays in-process so a single model instance keeps the GPU.
+    worker_count = 1
+    if total_files >= PARALLEL_ENCODE_MIN_FILES:
+        worker_count = min(
+            workers or os.cpu_count() or 1, math.ceil(total_files / ENCODE_CHUNK_SIZE)
+        )
+    if effective_mode == "cpu" and worker_count > 1:
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            _collect(executor.map(encode_one, training_files, chunksize=ENCODE_CHUNK_SIZE))
+    else:
+        _collect(map(encode_one, training_files))
+
+    if verbose and total_files:
+        print()
 
-        face_encodings = face_recognition.face_encodings(
-            image,
-            known_face_locations=face_locations,
-            num_jitters=num_jitters,
-            model=encoding_model,
+    # The stored rows are re-read under an OS lock, so a concurrent encode in another
+    # process (a second gateway worker, a manual run) cannot drop rows this merge
+    # never saw. Encoding itself stays outside the lock.
+    with _exclusive_file_lock(location.with_name(location.name + ".lock")):
+        kept_names: List[str] = []
+        kept_encodings = np.empty((0, 128), dtype=np.float32)
+        if people:
+            try:
+                existing = load_encodings(location)
+            except FileNotFoundError:
+                existing = None
+            if existing is not None:
+                # Rows of people whose training folder is gone are pruned as well.
+                still_enrolled = [
+                    name
+                    for name in existing["name_to_indices"]
+                    if name not in people and (TRAINING_DIR / name).is_dir()
+                ]
+                keep = np.isin(existing["names"], still_enrolled)
+                kept_names = existing["names"][keep].tolist()
+                kept_encodings = existing["encodings"][keep]
+
+        if not encodings and not kept_names:
+            raise RuntimeError("No encodings generated. Improve dataset quality or detector settings.")
+
+        encoding_matrix = np.concatenate(
+            [kept_encodings, np.asarray(encodings, dtype=np.float32).reshape(-1, 128)]
         )
+        _write_encodings(location, kept_names + names, encoding_matrix)
 
-        for encoding in face_encodings:
-            names.append(name)
-            encodings.append(encoding)
+        clear_encodings_cache()
 
-        if verbose:
-            processed = len(encodings)
-            sys.stdout.write(
-                f"Encoding {index}/{total_files} files | {processed} embeddings collected\r"
-            )
-            sys.stdout.flush()
 
-    if verbose and total_files:
-        print()
+def _load_dist128_kernel():
+    # Optional prebuilt AVX2 kernel for 128-d embeddings (see dist128.c).
+    suffix = ".dll" if sys.platform == "win32" else ".so"
+    library_path = MODULE_ROOT / f"_dist128{suffix}"
+    if not library_path.exists():
+        return None
+    try:
+        library = ctypes.CDLL(str(library_path))
+    except OSError:  # pragma: no cover - built for a different platform/ABI
+        return None
+    # Loading succeeds on any x86-64 host; the AVX2/FMA kernel itself would die
+    # with SIGILL on a CPU without them, so ask the library before using it.
+    supported = getattr(library, "dist128_supported", None)
+    if supported is None:
+        return None
+    supported.argtypes = []
+    supported.restype = ctypes.c_int
+    if not supported():
+        return None
+
+    kernel = library.sqdist128_batch
+    kernel.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.c_void_p,
+    ]
+    kernel.restype = None
+    return kernel
+
+
+_DIST128_KERNEL = _load_dist128_kernel()
+
+
+def _is_packed_float32(matrix: np.ndarray) -> bool:
+    return matrix.ndim == 2 and matrix.dtype == np.float32 and matrix.flags.c_contiguous
+
 
-    if not encodings:
-        raise RuntimeError("No encodings generated. Improve dataset quality or detector settings.")
+def _dist128_compatible(matrix: np.ndarray) -> bool:
+    # The kernel reads raw memory as packed float32 rows; any other layout would
+    # produce garbage distances, which on an auth path can mean a false match.
+    return _is_packed_float32(matrix) and matrix.shape[1] == 128
 
-    with encodings_location.open(mode="wb") as handle:
-        pickle.dump({"names": names, "encodings": encodings}, handle)
 
-    clear_encodings_cache()
+def _squared_distances_dist128(probes: np.ndarray, known: np.ndarray) -> np.ndarray:
+    out = np.empty((len(probes), len(known)), dtype=np.float32)
+    _DIST128_KERNEL(probes.ctypes.data, len(probes), known.ctypes.data, len(known), out.ctypes.data)
+    return out
 
 
-def _recognize_face(
-    unknown_encoding,
+def _squared_distances_loops(probes, known):  # pragma: no cover - compiled by numba
+    # Fused subtract/square/accumulate in one pass over each known row; LLVM
+    # vectorises the inner loop and prange spreads rows across cores.
+    out = np.empty((probes.shape[0], known.shape[0]), dtype=np.float32)
+    for row in numba.prange(known.shape[0]):
+        for probe_index in range(probes.shape[0]):
+            total = np.float32(0.0)
+            for k in range(known.shape[1]):
+                delta = known[row, k] - probes[probe_index, k]
+                total += delta * delta
+            out[probe_index, row] = total
+    return out
+
+
+@lru_cache(maxsize=1)
+def _squared_distances_jit():
+    # Compiled on first use rather than at import: processes that never match faces
+    # (the gateway) skip the parallel compile, and a failed compile or an unusable
+    # on-disk cache falls back to the other kernels instead of breaking the import.
+    if numba is None:
+        return None
+    try:
+        return numba.njit(
+            "f4[:, ::1](f4[:, ::1], f4[:, ::1])", fastmath=True, parallel=True, cache=True
+        )(_squared_distances_loops)
+    except Exception:  # pragma: no cover - depends on the numba/LLVM install
+        return None
+
+
+def _squared_distances(probes: np.ndarray, loaded_encodings, tolerance: float) -> np.ndarray:
+    known = loaded_encodings["encodings"]
+    if simsimd is not None and "encodings_q" in loaded_encodings:
+        return _squared_distances_quantized(probes, loaded_encodings, tolerance)
+    if _DIST128_KERNEL is not None and _dist128_compatible(probes) and _dist128_compatible(known):
+        return _squared_distances_dist128(probes, known)
+    if simsimd is not None and len(known):
+        # Hand-tuned AVX2/AVX-512/NEON kernels; dispatches on the running CPU.
+        return np.asarray(simsimd.cdist(probes, known, metric="sqeuclidean"))
+    jit_kernel = _squared_distances_jit()
+    if jit_kernel is not None and _is_packed_float32(probes) and _is_packed_float32(known):
+        return jit_kernel(probes, known)
+    return _squared_distances_blas(probes, loaded_encodings, tolerance)
+
+
+def _squared_distances_quantized(
+    probes: np.ndarray,
     loaded_encodings,
-    tolerance: float = 0.45,
-) -> Tuple[Optional[str], Optional[float]]:
-    comparisons = face_recognition.compare_faces(
-        loaded_encodings["encodings"], unknown_encoding, tolerance=tolerance
-    )
-    votes = Counter(
-        name
-        for match, name in zip(comparisons, loaded_encodings["names"])
-        if match
+    tolerance: float,
+) -> np.ndarray:
+    known = loaded_encodings["encodings"]
+    scale = loaded_encodings["q_scale"]
+    if float(np.abs(probes).max()) > 127.0 * scale:
+        return np.asarray(simsimd.cdist(probes, known, metric="sqeuclidean"))
+
+    probes_q = np.round(probes / scale).astype(np.int8)
+    approx = np.asarray(
+        simsimd.cdist(probes_q, loaded_encodings["encodings_q"], metric="sqeuclidean")
     )
 
-    distances = face_recognition.face_distance(
-        loaded_encodings["encodings"], unknown_encoding
-    )
-    if len(distances) == 0:
+    # Rounding moves each vector by at most scale * sqrt(d) / 2, so every true match
+    # lies within tolerance / scale + sqrt(d) in quantised units. Only those
+    # candidates get an exact float32 distance; the rest can never match.
+    bound = (tolerance / scale + math.sqrt(known.shape[1])) ** 2
+    candidates = approx <= bound
+    squared = np.full(approx.shape, np.inf)
+    columns = np.flatnonzero(candidates.any(axis=0))
+    if len(columns):
+        exact = np.asarray(simsimd.cdist(probes, known[columns], metric="sqeuclidean"))
+        squared[:, columns] = np.where(candidates[:, columns], exact, np.inf)
+    return squared
+
+
+def _squared_distances_blas(
+    probes: np.ndarray,
+    loaded_encodings,
+    tolerance: float,
+) -> np.ndarray:
+    known = loaded_encodings["encodings"]
+    known_half_norms = loaded_encodings["half_norms"]
+    probe_half_norms = 0.5 * np.einsum("ij,ij->i", probes, probes)
+
+    # Triangle inequality: | ||a|| - ||b|| | <= ||a - b||, so rows whose norm is
+    # more than ``tolerance`` away from the probe's can never match.
+    probe_norms = np.sqrt(2.0 * probe_half_norms)
+    candidates = np.abs(loaded_encodings["norms"][None, :] - probe_norms[:, None]) <= tolerance
+    columns = np.flatnonzero(candidates.any(axis=0))
+    if len(columns) == len(known):
+        return _half_norm_distances(probes, probe_half_norms, known, known_half_norms)
+
+    squared = np.full((len(probes), len(known)), np.inf, dtype=np.float32)
+    if len(columns):
+        subset = _half_norm_distances(
+            probes, probe_half_norms, known[columns], known_half_norms[columns]
+        )
+        squared[:, columns] = np.where(candidates[:, columns], subset, np.inf)
+    return squared
+
+
+def _half_norm_distances(probes, probe_half_norms, known, known_half_norms) -> np.ndarray:
+    # ||a - b||^2 = 2 * (||a||^2 / 2 + ||b||^2 / 2 - a.b): one GEMM of every probe
+    # against the known matrix instead of materialising the full difference array.
+    squared = 2.0 * (known_half_norms[None, :] + probe_half_norms[:, None] - probes @ known.T)
+    return np.maximum(squared, 0.0, out=squared)
+
+
+def _stack_probes(face_encodings) -> np.ndarray:
+    return np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+
+
+def _pick_match(
+    squared: np.ndarray,
+    loaded_encodings,
+    tolerance: float,
+) -> Tuple[Optional[str], Optional[float]]:
+    if len(squared) == 0:
         return None, None
 
+    # Compare in squared space so only the reported distance needs a sqrt.
+    matches = squared <= tolerance * tolerance
+    names = loaded_encodings["names"]
+    votes = Counter(names[matches].tolist())
+
     if votes:
         winner = votes.most_common(1)[0][0]
-        winner_distances = [
-            distance
-            for distance, candidate in zip(distances, loaded_encodings["names"])
-            if candidate == winner
-        ]
-        best_distance = float(min(winner_distances)) if winner_distances else float(min(distances))
+        # The winner's closest row is always one of its matches.
+        winner_rows = loaded_encodings["name_to_indices"][winner]
+        best_distance = float(np.sqrt(squared[winner_rows].min()))
         return winner, best_distance
 
-    best_index, best_distance = min(enumerate(distances), key=lambda pair: pair[1])
-    best_distance = float(best_distance)
+    best_index = int(squared.argmin())
+    best_distance = float(np.sqrt(squared[best_index]))
     if best_distance <= tolerance:
-        return loaded_encodings["names"][best_index], best_distance
+        return str(names[best_index]), best_distance
     return None, None
 
 
@@ -229,35 +619,110 @@ def _display_face(draw, bounding_box, name):
     )
 
 
-def match_face(
-    image_bytes: bytes,
-    encodings_location: Path = DEFAULT_ENCODINGS_PATH,
-    detector_model: str = "hog",
-    encoding_model: str = "small",
-    tolerance: float = 0.45,
-):
-    if not image_bytes:
-        raise ValueError("Image payload is empty.")
+def _downscale_for_detection(image: np.ndarray, max_side: int = DETECTION_MAX_SIDE):
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return image, 1.0
 
-    loaded_encodings = load_encodings(encodings_location)
+    scale = max_side / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    resized = Image.fromarray(image).resize(size, Image.BILINEAR)
+    return np.asarray(resized), scale
 
-    image_stream = io.BytesIO(image_bytes)
+
+def _rescale_face_locations(face_locations, scale: float, shape) -> list:
+    if scale == 1.0:
+        return list(face_locations)
+
+    height, width = shape[:2]
+    return [
+        (
+            max(0, round(top / scale)),
+            min(width, round(right / scale)),
+            min(height, round(bottom / scale)),
+            max(0, round(left / scale)),
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def _payload_digest(image: Union[bytes, BinaryIO]) -> bytes:
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(image).digest()
+
+    image.seek(0)
+    if hasattr(hashlib, "file_digest"):
+        # Python 3.11+: hashes BytesIO through getbuffer() without a copy and
+        # streams spooled uploads through one reusable buffer.
+        digest = hashlib.file_digest(image, "sha256")
+    else:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: image.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    image.seek(0)
+    return digest.digest()
+
+
+def _encode_probe(
+    image: Union[bytes, BinaryIO],
+    detector_model: str,
+    encoding_model: str,
+) -> Tuple[list, np.ndarray]:
+    cache_key = (_payload_digest(image), detector_model, encoding_model)
+    with _PROBE_CACHE_LOCK:
+        cached = _PROBE_CACHE.get(cache_key)
+        if cached is not None:
+            _PROBE_CACHE.move_to_end(cache_key)
+            return cached
+
+    # File-like uploads are decoded in place rather than copied into a bytes buffer.
+    image_stream = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
     image = face_recognition.load_image_file(image_stream)
 
-    face_locations = face_recognition.face_locations(image, model=detector_model)
+    # HOG detection cost scales with pixel count; detect on a downscaled copy and
+    # map the boxes back so encodings still use the full-resolution crop.
+    detection_image, scale = _downscale_for_detection(image)
+    face_locations = face_recognition.face_locations(detection_image, model=detector_model)
     if not face_locations:
-        return None
+        return [], _stack_probes([])
+    face_locations = _rescale_face_locations(face_locations, scale, image.shape)
 
     face_encodings = face_recognition.face_encodings(
         image,
         known_face_locations=face_locations,
         model=encoding_model,
     )
+    if not face_encodings:
+        return face_locations, _stack_probes([])
 
-    for bounding_box, face_encoding in zip(face_locations, face_encodings):
-        name, distance = _recognize_face(
-            face_encoding, loaded_encodings, tolerance=tolerance
-        )
+    probes = _stack_probes(face_encodings)
+    with _PROBE_CACHE_LOCK:
+        _PROBE_CACHE[cache_key] = (face_locations, probes)
+        while len(_PROBE_CACHE) > PROBE_CACHE_SIZE:
+            _PROBE_CACHE.popitem(last=False)
+    return face_locations, probes
+
+
+def match_face(
+    image: Union[bytes, BinaryIO],
+    encodings_location: Path = DEFAULT_ENCODINGS_PATH,
+    detector_model: str = "hog",
+    encoding_model: str = "small",
+    tolerance: float = 0.45,
+):
+    if isinstance(image, (bytes, bytearray)) and not image:
+        raise ValueError("Image payload is empty.")
+
+    loaded_encodings = load_encodings(encodings_location)
+
+    face_locations, probes = _encode_probe(image, detector_model, encoding_model)
+    if not len(probes):
+        return None
+
+    squared = _squared_distances(probes, loaded_encodings, tolerance)
+    for bounding_box, face_squared in zip(face_locations, squared):
+        name, distance = _pick_match(face_squared, loaded_encodings, tolerance)
         if name:
             return {
                 "name": name,
@@ -290,12 +755,15 @@ def recognize_faces(
     pillow_image = Image.fromarray(input_image)
     draw = ImageDraw.Draw(pillow_image)
 
-    for bounding_box, unknown_encoding in zip(
-        input_face_locations, input_face_encodings
-    ):
-        name, _ = _recognize_face(
-            unknown_encoding, loaded_encodings, tolerance=tolerance
+    squared = (
+        _squared_distances(
+            _stack_probes(input_face_encodings), loaded_encodings, tolerance
         )
+        if input_face_encodings
+        else []
+    )
+    for bounding_box, face_squared in zip(input_face_locations, squared):
+        name, _ = _pick_match(face_squared, loaded_encodings, tolerance)
         if not name:
             name = "Unknown"
         _display_face(draw, bounding_box, name)
@@ -1,32 +1,52 @@
 import asyncio
 import base64
-import json
+import hashlib
+import hmac
+import io
+import math
+import multiprocessing
 import os
+import secrets
+import shutil
 import sys
 import time
+import weakref
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlencode
 
-import jwt
-import requests
+import httpx
+import orjson
 from fastapi import Body, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+from common import parse_classification
 from face_model import encode_known_faces, slugify_name, store_face_samples
 
 SECRET = os.getenv("SECRET", "CIPHERA_KEY")
+SECRET_BYTES = SECRET.encode("utf-8")
+TOKEN_TTL_SECONDS = 3600
 
 # Static verifier node configuration for demo purposes.
-NODES: List[str] = [
+NODES: Tuple[str, ...] = (
     "http://127.0.0.1:8001",
     "http://127.0.0.1:8002",
-]
+)
 if not NODES:
     raise ValueError("No verifier nodes configured. Set NODES environment variable.")
+REQUIRED_MAJORITY = (len(NODES) // 2) + 1
+# Overall deadline per node call; the client timeout only bounds each I/O phase.
+NODE_TIMEOUT_SECONDS = float(os.getenv("NODE_TIMEOUT_SECONDS", "15"))
 
 FACE_ENCODER_MODE = os.getenv("FACE_ENCODER_MODE", "cpu").lower()
 if FACE_ENCODER_MODE not in {"cpu", "gpu"}:
@@ -34,8 +54,181 @@ if FACE_ENCODER_MODE not in {"cpu", "gpu"}:
 
 FACE_SAMPLES_REQUIRED = int(os.getenv("FACE_SAMPLES_REQUIRED", "10"))
 
+# Multiple of 4 so every slice of a base64 payload decodes independently.
+BASE64_CHUNK_CHARS = 64 * 1024
+# Decoded samples stay in memory up to this size before spilling to a temp file.
+SAMPLE_SPOOL_MAX_BYTES = 1 << 20
+
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+# HS256 tokens are signed directly: the header never changes, so it is encoded once
+# and each token costs one payload dump plus one HMAC-SHA256.
+JWT_HEADER_B64 = _b64url(orjson.dumps({"alg": "HS256", "typ": "JWT"}))
+
+
+def _encode_jwt(payload: Dict[str, object]) -> str:
+    signing_input = JWT_HEADER_B64 + b"." + _b64url(orjson.dumps(payload))
+    signature = hmac.new(SECRET_BYTES, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url(signature)).decode("ascii")
+
+
+def _encode_multipart_file(
+    field: str,
+    filename: str,
+    content: BinaryIO,
+    content_type: str,
+) -> Tuple[bytes, str]:
+    # Built once per request and posted as raw bytes to every node, instead of
+    # letting the client re-encode an identical envelope for each one. The upload
+    # is copied from its spool straight into the envelope, so the image is not also
+    # held as a separate read() result.
+    boundary = secrets.token_hex(16)
+    filename = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "").replace("\n", "")
+    content_type = content_type.replace("\r", "").replace("\n", "")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+    envelope = io.BytesIO()
+    envelope.write(head)
+    shutil.copyfileobj(content, envelope)
+    envelope.write(tail)
+    return envelope.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def _decode_base64_chunked(encoded: str, offset: int = 0) -> SpooledTemporaryFile:
+    # Decoding slice by slice into a spool avoids the full-size ASCII copy b64decode
+    # makes of a str and never holds the whole image as one bytes object. ``offset``
+    # lets callers skip a data: URI header without slicing the payload out first.
+    spool = SpooledTemporaryFile(max_size=SAMPLE_SPOOL_MAX_BYTES)
+    try:
+        for start in range(offset, len(encoded), BASE64_CHUNK_CHARS):
+            spool.write(base64.b64decode(encoded[start : start + BASE64_CHUNK_CHARS]))
+    except (base64.binascii.Error, ValueError):
+        # Embedded whitespace shifts the 4-character alignment; decode in one go instead.
+        spool.seek(0)
+        spool.truncate()
+        try:
+            spool.write(base64.b64decode(encoded[offset:]))
+        except (base64.binascii.Error, ValueError):
+            spool.close()
+            raise
+    spool.seek(0)
+    return spool
+
+
+def _close_samples(samples: List[Union[bytes, BinaryIO]]) -> None:
+    for sample in samples:
+        if not isinstance(sample, (bytes, bytearray)):
+            sample.close()
+
+
+# Shared client so node calls reuse pooled keep-alive connections across requests
+# instead of paying a TCP handshake per node per call.
+HTTP_CLIENT = httpx.AsyncClient(
+    timeout=15,
+    limits=httpx.Limits(max_keepalive_connections=64, keepalive_expiry=30.0),
+)
+
+
+async def _post_to_node(
+    node: str,
+    path: str,
+    content: bytes,
+    content_type: str,
+    **error_fields: object,
+) -> Dict[str, object]:
+    # Transport failures become an error entry for that node so one dead verifier
+    # never aborts the whole fan-out.
+    try:
+        response = await asyncio.wait_for(
+            HTTP_CLIENT.post(
+                f"{node}{path}",
+                content=content,
+                headers={"Content-Type": content_type},
+            ),
+            NODE_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        payload = orjson.loads(response.content)
+    except asyncio.TimeoutError:
+        return {"node": node, "error": "Node timed out.", **error_fields}
+    except (httpx.HTTPError, orjson.JSONDecodeError) as exc:
+        return {"node": node, "error": str(exc), **error_fields}
+    if not isinstance(payload, dict):
+        return {"node": node, "error": "Node returned a non-object JSON body.", **error_fields}
+    payload["node"] = node
+    return payload
+
+
+# Face encoding is CPU-bound dlib work; it runs in a dedicated process so it neither
+# holds the gateway's GIL nor races concurrent enrolments merging into the same
+# encodings file. encode_known_faces fans out across cores inside that process.
+ENCODE_POOL: Optional[ProcessPoolExecutor] = None
+
+# Enrolments that arrive while an encode is running are merged into the next run.
+ENCODE_LOCK = asyncio.Lock()
+_PENDING_ENCODE: Optional[Tuple[Set[str], "asyncio.Task[None]"]] = None
+
+
+# One lock per face slug serialises a person's store and encode (a double-submitted
+# form, say) without blocking other people's enrolments; idle locks drop out.
+_SLUG_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _slug_lock(person_slug: str) -> asyncio.Lock:
+    lock = _SLUG_LOCKS.get(person_slug)
+    if lock is None:
+        lock = _SLUG_LOCKS[person_slug] = asyncio.Lock()
+    return lock
+
+
+async def _encode_batch(slugs: Set[str]) -> None:
+    global _PENDING_ENCODE
+    async with ENCODE_LOCK:
+        # Close the batch; enrolments from here on queue behind this run.
+        _PENDING_ENCODE = None
+        refresh_encodings = partial(
+            encode_known_faces, mode=FACE_ENCODER_MODE, verbose=False, people=sorted(slugs)
+        )
+        await asyncio.get_running_loop().run_in_executor(ENCODE_POOL, refresh_encodings)
+
+
+async def _refresh_encodings(person_slug: str) -> None:
+    global _PENDING_ENCODE
+    if _PENDING_ENCODE is None:
+        slugs: Set[str] = set()
+        _PENDING_ENCODE = (slugs, asyncio.create_task(_encode_batch(slugs)))
+    slugs, batch = _PENDING_ENCODE
+    slugs.add(person_slug)
+    # Shielded so one caller going away does not cancel the run the others share.
+    await asyncio.shield(batch)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ENCODE_POOL
+    # Spawned, not forked: the gateway already runs threadpool threads by the time it
+    # serves, and forking a multi-threaded process can leave locks held in the child.
+    ENCODE_POOL = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        yield
+    finally:
+        ENCODE_POOL.shutdown(wait=True)
+        ENCODE_POOL = None
+        await HTTP_CLIENT.aclose()
+
 
-app = FastAPI(title="CiphERA Gateway", version="1.0.0")
+app = FastAPI(
+    title="CiphERA Gateway",
+    version="1.0.0",
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -91,38 +284,24 @@ async def register_user(request: Request):
             },
         )
 
-    sample_payloads: List[bytes] = []
+    # Uploads stay in their spooled temp files and are copied to the dataset on disk,
+    # so enrolment never holds every sample image as a bytes object at once.
+    sample_payloads: List[Union[bytes, BinaryIO]] = []
 
-    raw_candidates: List[object] = []
-    if hasattr(form_data, "getlist"):
-        for field_name in ("face_samples", "face_samples[]"):
-            try:
-                items = form_data.getlist(field_name)
-            except (AttributeError, TypeError):
-                items = None
-            if items:
-                raw_candidates.extend(items)
-
-    if not raw_candidates:
-        fallback_entry = form_data.get("face_samples")
-        if fallback_entry is not None:
-            raw_candidates.append(fallback_entry)
-
-    if hasattr(form_data, "multi_items"):
-        try:
-            for key, value in form_data.multi_items():
-                if key == "face_samples" or key.startswith("face_samples["):
-                    raw_candidates.append(value)
-        except (AttributeError, TypeError):
-            pass
+    # One pass over the multipart items yields each face_samples / face_samples[...]
+    # part exactly once, so no identity-based de-duplication is needed.
+    raw_candidates: List[object] = [
+        value
+        for key, value in form_data.multi_items()
+        if key == "face_samples" or key.startswith("face_samples[")
+    ]
 
-    seen_uploads: set[int] = set()
     for entry in raw_candidates:
+        # Starlette already spools each part to disk; stop pulling samples into memory
+        # once the enrolment quota is met instead of reading and discarding extras.
+        if FACE_SAMPLES_REQUIRED and len(sample_payloads) >= FACE_SAMPLES_REQUIRED:
+            break
         if isinstance(entry, UploadFile) or (hasattr(entry, "read") and hasattr(entry, "filename")):
-            entry_id = id(entry)
-            if entry_id in seen_uploads:
-                continue
-            seen_uploads.add(entry_id)
             try:
                 await entry.seek(0)
             except (AttributeError, TypeError):
@@ -130,29 +309,37 @@ async def register_user(request: Request):
                     entry.file.seek(0)  # type: ignore[attr-defined]
                 except Exception:
                     pass
-            payload = await entry.read()
-            if payload:
-                sample_payloads.append(payload)
-            await entry.close()
+            if not hasattr(entry, "file"):
+                payload = await entry.read()
+                if payload:
+                    sample_payloads.append(payload)
+                await entry.close()
+            elif await entry.read(1):
+                await entry.seek(0)
+                sample_payloads.append(entry.file)
         elif isinstance(entry, (bytes, bytearray)):
             if entry:
                 sample_payloads.append(bytes(entry))
-        elif isinstance(entry, str) and entry:
-            if entry.startswith("data:") and "," in entry:
-                _, encoded = entry.split(",", 1)
+        elif isinstance(entry, str) and entry[:5] == "data:":
+            # Locate the header comma and decode from there rather than splitting off
+            # a second multi-megabyte copy of the payload.
+            comma = entry.find(",", 5)
+            if comma > 0:
                 try:
-                    decoded = base64.b64decode(encoded)
+                    decoded = _decode_base64_chunked(entry, comma + 1)
                 except (base64.binascii.Error, ValueError):
-                    decoded = b""
-                if decoded:
+                    continue
+                if decoded.seek(0, os.SEEK_END):
+                    decoded.seek(0)
                     sample_payloads.append(decoded)
+                else:
+                    decoded.close()
 
     primary_file = form_data.get("file")
     if not sample_payloads and isinstance(primary_file, UploadFile):
-        fallback = await primary_file.read()
-        if fallback:
-            sample_payloads.append(fallback)
-        await primary_file.close()
+        if await primary_file.read(1):
+            await primary_file.seek(0)
+            sample_payloads.append(primary_file.file)
 
     if not sample_payloads:
         raise HTTPException(
@@ -164,6 +351,7 @@ async def register_user(request: Request):
         )
 
     if FACE_SAMPLES_REQUIRED and len(sample_payloads) < FACE_SAMPLES_REQUIRED:
+        _close_samples(sample_payloads)
         raise HTTPException(
             status_code=400,
             detail={
@@ -172,60 +360,48 @@ async def register_user(request: Request):
             },
         )
 
-    if FACE_SAMPLES_REQUIRED:
-        sample_payloads = sample_payloads[:FACE_SAMPLES_REQUIRED]
-
-    first_name = first_name.strip()
-    middle_name = (middle_name or "").strip() or None
-    last_name = last_name.strip()
-    phone = phone.strip()
-    address_line1 = address_line1.strip()
-    address_line2 = (address_line2 or "").strip() or None
-    city = city.strip()
-    state = (state or "").strip() or None
-    postal_code = postal_code.strip()
-    country = country.strip()
+    # Fields were stripped and presence-checked by _required/_optional above.
+    full_name = name or " ".join(part for part in (first_name, middle_name, last_name) if part)
 
-    if not all([first_name, last_name, phone, address_line1, city, postal_code, country]):
-        raise HTTPException(status_code=400, detail={"message": "Missing required profile attributes."})
+    classification_payload = parse_classification(classification_raw)
 
-    full_name = (name or " ".join(filter(None, [first_name, middle_name, last_name]))).strip()
-
-    try:
-        classification_payload = json.loads(classification_raw) if classification_raw else None
-    except json.JSONDecodeError:
-        classification_payload = classification_raw
+    # Forward the parsed value in canonical form; unparseable labels become JSON
+    # strings, which the nodes decode back to the same raw value.
+    classification_canonical = (
+        orjson.dumps(classification_payload).decode() if classification_payload is not None else ""
+    )
 
     person_slug = slugify_name(first_name, last_name, email)
 
-    try:
-        saved_paths = store_face_samples(person_slug, sample_payloads, replace=True)
-    except OSError as exc:
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "message": "Failed to persist face samples to the training dataset.",
-                "reason": str(exc),
-            },
-        ) from exc
-
-    def _refresh_encodings() -> None:
-        encode_known_faces(mode=FACE_ENCODER_MODE, verbose=False)
+    # Held until the encode has finished, so a second registration for the same slug
+    # cannot rmtree the folder mid-store or while the encode batch is reading it.
+    async with _slug_lock(person_slug):
+        try:
+            # Disk writes of every sample would otherwise stall the event loop for all clients.
+            saved_paths = await run_in_threadpool(
+                store_face_samples, person_slug, sample_payloads, replace=True
+            )
+        except OSError as exc:
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "message": "Failed to persist face samples to the training dataset.",
+                    "reason": str(exc),
+                },
+            ) from exc
+        finally:
+            _close_samples(sample_payloads)
 
-    try:
         try:
-            await asyncio.to_thread(_refresh_encodings)
-        except AttributeError:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, _refresh_encodings)
-    except Exception as exc:
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "message": "Failed to refresh face recognition encodings after enrollment.",
-                "reason": str(exc),
-            },
-        ) from exc
+            await _refresh_encodings(person_slug)
+        except Exception as exc:
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "message": "Failed to refresh face recognition encodings after enrollment.",
+                    "reason": str(exc),
+                },
+            ) from exc
 
     profile = {
         "first_name": first_name,
@@ -243,36 +419,33 @@ async def register_user(request: Request):
         "sample_count": len(sample_payloads),
     }
 
-    results = []
-    for node in NODES:
-        try:
-            response = requests.post(
-                f"{node}/register",
-                data={
-                    "name": full_name,
-                    "email": email,
-                    "first_name": first_name,
-                    "middle_name": middle_name or "",
-                    "last_name": last_name,
-                    "phone": phone,
-                    "address_line1": address_line1,
-                    "address_line2": address_line2 or "",
-                    "city": city,
-                    "state": state or "",
-                    "postal_code": postal_code,
-                    "country": country,
-                    "classification": classification_raw or "",
-                    "face_slug": person_slug,
-                    "sample_count": str(len(sample_payloads)),
-                },
-                timeout=15,
-            )
-            response.raise_for_status()
-            payload = response.json()
-            payload["node"] = node
-            results.append(payload)
-        except requests.RequestException as exc:
-            results.append({"node": node, "error": str(exc)})
+    # Every node receives the same form, so urlencode it once for the whole fan-out.
+    register_body = urlencode(
+        {
+            "name": full_name,
+            "email": email,
+            "first_name": first_name,
+            "middle_name": middle_name or "",
+            "last_name": last_name,
+            "phone": phone,
+            "address_line1": address_line1,
+            "address_line2": address_line2 or "",
+            "city": city,
+            "state": state or "",
+            "postal_code": postal_code,
+            "country": country,
+            "classification": classification_canonical,
+            "face_slug": person_slug,
+            "sample_count": str(len(sample_payloads)),
+        }
+    ).encode("ascii")
+
+    results = await asyncio.gather(
+        *(
+            _post_to_node(node, "/register", register_body, "application/x-www-form-urlencoded")
+            for node in NODES
+        )
+    )
 
     stored_nodes = [result for result in results if result.get("status") == "stored"]
     if not stored_nodes:
@@ -301,46 +474,62 @@ async def register_user(request: Request):
 
 @app.post("/api/signin")
 async def signin_user(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    if not image_bytes:
+    if not await file.read(1):
         raise HTTPException(status_code=400, detail={"message": "No image content received."})
-
-    votes = []
-    for node in NODES:
-        try:
-            response = requests.post(
-                f"{node}/verify-face",
-                files={
-                    "file": (
-                        file.filename or "face.jpg",
-                        image_bytes,
-                        file.content_type or "image/jpeg",
-                    )
-                },
-                timeout=15,
-            )
-            response.raise_for_status()
-            payload = response.json()
-            payload["node"] = node
-            votes.append(payload)
-        except requests.RequestException as exc:
-            votes.append({"node": node, "error": str(exc), "verified": False})
-
-    positive_votes = [vote for vote in votes if vote.get("verified")]
-    required_majority = (len(NODES) // 2) + 1
-
-    if len(positive_votes) >= required_majority:
+    await file.seek(0)
+
+    # Large uploads roll over to disk, so the copy runs off the event loop.
+    body, content_type = await run_in_threadpool(
+        _encode_multipart_file,
+        "file",
+        file.filename or "face.jpg",
+        file.file,
+        file.content_type or "image/jpeg",
+    )
+
+    votes: List[Dict[str, object]] = []
+    positive_votes: List[Dict[str, object]] = []
+
+    # Count votes as they arrive and stop as soon as the outcome is settled: at quorum,
+    # or once the nodes still pending can no longer reach it. With two nodes a single
+    # rejection ends sign-in without waiting for the other node.
+    tasks = [
+        asyncio.create_task(_post_to_node(node, "/verify-face", body, content_type, verified=False))
+        for node in NODES
+    ]
+    try:
+        for next_vote in asyncio.as_completed(tasks):
+            vote = await next_vote
+            votes.append(vote)
+            if vote.get("verified"):
+                positive_votes.append(vote)
+                if len(positive_votes) >= REQUIRED_MAJORITY:
+                    break
+            elif len(positive_votes) + len(tasks) - len(votes) < REQUIRED_MAJORITY:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if len(positive_votes) >= REQUIRED_MAJORITY:
         primary_vote = positive_votes[0]
         user_email = primary_vote.get("user")
 
-        sources: List[Optional[str]] = []
+        # Single pass over the quorum votes: dedupe sources, collect profile
+        # entries and keep running distance stats.
+        sources: Dict[str, None] = {}
         entries: List[Dict[str, object]] = []
+        nodes_list: List[Optional[str]] = []
         classification_value: Optional[object] = None
+        best_distance = math.inf
+        distance_sum = 0.0
+        distance_count = 0
 
         for vote in positive_votes:
             node_name = vote.get("node")
+            nodes_list.append(node_name)
             if node_name:
-                sources.append(node_name)
+                sources[node_name] = None
             profile_entry = vote.get("profile")
             if profile_entry is not None:
                 entry_payload: Dict[str, object] = {"node": node_name, "profile": profile_entry}
@@ -349,49 +538,46 @@ async def signin_user(file: UploadFile = File(...)):
                     classification_candidate = profile_entry.get("classification")
                     if classification_candidate not in (None, ""):
                         classification_value = classification_candidate
-
-        if sources:
-            sources = list(dict.fromkeys(sources))
+            distance = vote.get("distance")
+            if isinstance(distance, (int, float)):
+                distance = float(distance)
+                if distance < best_distance:
+                    best_distance = distance
+                distance_sum += distance
+                distance_count += 1
 
         aggregated_profile: Optional[Dict[str, object]] = None
         if entries:
             aggregated_profile = {
                 "email": user_email,
-                "sources": sources,
+                "sources": list(sources),
                 "entries": entries,
             }
             if classification_value is not None:
                 aggregated_profile["classification"] = classification_value
 
-        distance_values = [
-            float(vote.get("distance"))
-            for vote in positive_votes
-            if isinstance(vote.get("distance"), (int, float))
-        ]
-
         metrics: Optional[Dict[str, object]] = None
-        if distance_values:
-            best_distance = min(distance_values)
-            average_distance = sum(distance_values) / len(distance_values)
+        if distance_count:
+            average_distance = distance_sum / distance_count
             confidence = max(0.0, min(1.0, 1.0 - best_distance))
             metrics = {
                 "best_distance": round(best_distance, 4),
                 "average_distance": round(average_distance, 4),
                 "confidence": round(confidence, 4),
                 "positive_votes": len(positive_votes),
-                "required_majority": required_majority,
+                "required_majority": REQUIRED_MAJORITY,
             }
 
-        issued_at = int(time.time())
+        issued_at = time.time_ns() // 1_000_000_000
         payload = {
             "user": user_email,
-            "nodes": [vote.get("node") for vote in positive_votes],
+            "nodes": nodes_list,
             "profile": aggregated_profile,
             "metrics": metrics,
             "iat": issued_at,
-            "exp": issued_at + 3600,
+            "exp": issued_at + TOKEN_TTL_SECONDS,
         }
-        token = jwt.encode(payload, SECRET, algorithm="HS256")
+        token = _encode_jwt(payload)
         response_payload = {
             "authenticated": True,
             "user": user_email,
@@ -411,44 +597,39 @@ async def signin_classifier(label: str = Body(..., embed=True)):
     if not classifier_label:
         raise HTTPException(status_code=400, detail={"message": "Classifier label required."})
 
-    results = []
-    aggregated: Dict[str, dict] = {}
-
-    for node in NODES:
-        try:
-            response = requests.post(
-                f"{node}/classifier-lookup",
-                json={"label": classifier_label},
-                timeout=15,
-            )
-            response.raise_for_status()
-            payload = response.json()
-            payload["node"] = node
-            results.append(payload)
-
-            for match in payload.get("matches", []):
-                email = match.get("email")
-                key = email or f"{node}:{match.get('name')}"
-                entry = {
+    lookup_body = orjson.dumps({"label": classifier_label})
+    results = await asyncio.gather(
+        *(
+            _post_to_node(node, "/classifier-lookup", lookup_body, "application/json")
+            for node in NODES
+        )
+    )
+    # The first match seen for a key fills its identity fields; later ones only add sources.
+    aggregated: Dict[str, dict] = defaultdict(
+        lambda: {"email": None, "name": None, "sources": [], "profile": None}
+    )
+
+    for payload in results:
+        node = payload["node"]
+        for match in payload.get("matches", ()):
+            email = match.get("email")
+            name = match.get("name")
+            profile = match.get("profile")
+            key = email or f"{node}:{name}"
+            entry = aggregated[key]
+            if not entry["sources"]:
+                entry["email"] = email
+                entry["name"] = name
+                entry["profile"] = profile
+            entry["sources"].append(
+                {
                     "node": node,
                     "email": email,
-                    "name": match.get("name"),
-                    "profile": match.get("profile"),
+                    "name": name,
+                    "profile": profile,
                     "probability": match.get("probability"),
                 }
-
-                existing = aggregated.get(key)
-                if existing:
-                    existing["sources"].append(entry)
-                else:
-                    aggregated[key] = {
-                        "email": email,
-                        "name": match.get("name"),
-                        "sources": [entry],
-                        "profile": match.get("profile"),
-                    }
-        except requests.RequestException as exc:
-            results.append({"node": node, "error": str(exc)})
+            )
 
     matches = list(aggregated.values())
 
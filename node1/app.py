@@ -1,18 +1,40 @@
-import json
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 import sys
 from threading import Lock
-from typing import Dict, Optional
+from typing import Dict, List, NamedTuple, Optional
 
-from fastapi import Body, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import Body, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+import orjson
+from pydantic import BaseModel, ValidationError
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from face_model import clear_encodings_cache, match_face
+from common import parse_classification
+from face_model import load_encodings, match_face
 
-app = FastAPI(title="CiphERA Node 1", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse users.json and load the encodings matrix before the first probe, so
+    # the first /verify-face after a restart does not pay for either.
+    load_users()
+    try:
+        await run_in_threadpool(load_encodings)
+    except FileNotFoundError:
+        pass
+    yield
+
+
+app = FastAPI(
+    title="CiphERA Node 1",
+    version="1.0.0",
+    lifespan=lifespan,
+)
 
 USERS_DB_PATH = Path(__file__).resolve().parent / "users.json"
 LOCK = Lock()
@@ -21,64 +43,146 @@ def ensure_db() -> None:
     if not USERS_DB_PATH.exists():
         USERS_DB_PATH.write_text("{}", encoding="utf-8")
 
-def load_users() -> Dict[str, Dict[str, object]]:
+
+class UsersSnapshot(NamedTuple):
+    mtime: Optional[int]
+    users: Dict[str, Dict[str, object]]
+    by_slug: Dict[str, str]
+    by_label: Dict[str, List[Dict[str, object]]]
+
+
+# Parsed users.json and its lookup indexes, published as one immutable snapshot so
+# readers never lock: replacing _USERS_REF[0] is a single reference swap.
+_USERS_REF: List[UsersSnapshot] = [UsersSnapshot(None, {}, {}, {})]
+
+
+def _publish_users(mtime: int, data: Dict[str, Dict[str, object]]) -> UsersSnapshot:
+    by_slug: Dict[str, str] = {}
+    by_label: Dict[str, List[Dict[str, object]]] = {}
+    for email, record in data.items():
+        stored_slug = record.get("face_slug") or (record.get("profile") or {}).get("face_slug")
+        if stored_slug:
+            # First enrolment wins, matching the order the linear scan used to see.
+            by_slug.setdefault(stored_slug, email)
+
+        profile = record.get("profile") or {}
+        classification = profile.get("classification")
+        classifier_label = None
+        probability = None
+        if isinstance(classification, dict):
+            classifier_label = classification.get("label")
+            probability = classification.get("probability")
+        elif isinstance(classification, str):
+            classifier_label = classification
+        if isinstance(classifier_label, str) and classifier_label.strip():
+            # Keys are normalised once here so lookups are a single dict probe.
+            by_label.setdefault(classifier_label.strip().casefold(), []).append(
+                {
+                    "email": email,
+                    "name": record.get("name"),
+                    "profile": profile,
+                    "probability": probability,
+                }
+            )
+
+    snapshot = UsersSnapshot(mtime, data, by_slug, by_label)
+    _USERS_REF[0] = snapshot
+    return snapshot
+
+
+def users_snapshot() -> UsersSnapshot:
     ensure_db()
-    with USERS_DB_PATH.open("r", encoding="utf-8") as handle:
-        try:
-            data = json.load(handle)
-        except json.JSONDecodeError:
-            data = {}
-    return data
+    mtime = USERS_DB_PATH.stat().st_mtime_ns
+    snapshot = _USERS_REF[0]
+    if snapshot.mtime == mtime:
+        return snapshot
+    try:
+        data = orjson.loads(USERS_DB_PATH.read_bytes())
+    except orjson.JSONDecodeError:
+        data = {}
+    return _publish_users(mtime, data)
 
 
-def save_users(data: Dict[str, Dict[str, object]]) -> None:
-    with USERS_DB_PATH.open("w", encoding="utf-8") as handle:
-        json.dump(data, handle)
+def load_users() -> Dict[str, Dict[str, object]]:
+    return users_snapshot().users
 
 
+def save_users(data: Dict[str, Dict[str, object]]) -> None:
+    # Write a synced temporary and swap it in, so a crash mid-write never leaves a
+    # truncated users.json that would load as an empty table.
+    tmp_path = USERS_DB_PATH.with_name(USERS_DB_PATH.name + ".tmp")
+    with tmp_path.open("wb") as handle:
+        handle.write(orjson.dumps(data))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, USERS_DB_PATH)
+    # The written table is already parsed; publish it without re-reading the file.
+    _publish_users(USERS_DB_PATH.stat().st_mtime_ns, data)
+
+
+class RegisterForm(BaseModel):
+    model_config = {"extra": "ignore"}
+
+    first_name: str
+    last_name: str
+    email: str
+    middle_name: Optional[str] = None
+    phone: str
+    address_line1: str
+    address_line2: Optional[str] = None
+    city: str
+    state: Optional[str] = None
+    postal_code: str
+    country: str
+    name: Optional[str] = None
+    classification: Optional[str] = None
+    face_slug: Optional[str] = None
+    sample_count: Optional[str] = None
+
+    @classmethod
+    def from_form(cls, form) -> "RegisterForm":
+        # Normalize profile fields for consistent ledger entries. Blank values are dropped so
+        # optional fields fall back to None and required ones fail validation.
+        fields = {}
+        for key, value in form.items():
+            if isinstance(value, str):
+                value = value.strip()
+                if value:
+                    fields[key] = value
+        return cls.model_validate(fields)
+
+
+# One model validation per request instead of a Form() dependency per field.
 @app.post("/register")
-async def register_user(
-    first_name: str = Form(...),
-    last_name: str = Form(...),
-    email: str = Form(...),
-    file: Optional[UploadFile] = File(None),
-    middle_name: Optional[str] = Form(None),
-    phone: str = Form(...),
-    address_line1: str = Form(...),
-    address_line2: Optional[str] = Form(None),
-    city: str = Form(...),
-    state: Optional[str] = Form(None),
-    postal_code: str = Form(...),
-    country: str = Form(...),
-    name: Optional[str] = Form(None),
-    classification: Optional[str] = Form(None),
-    face_slug: Optional[str] = Form(None),
-    sample_count: Optional[str] = Form(None),
-):
-    if file is not None:
-        await file.read()
-
-    # Normalize profile fields for consistent ledger entries.
-    first_name = first_name.strip()
-    middle_name = (middle_name or "").strip() or None
-    last_name = last_name.strip()
-    phone = phone.strip()
-    address_line1 = address_line1.strip()
-    address_line2 = (address_line2 or "").strip() or None
-    city = city.strip()
-    state = (state or "").strip() or None
-    postal_code = postal_code.strip()
-    country = country.strip()
-
-    if not all([first_name, last_name, phone, address_line1, city, postal_code, country]):
-        raise HTTPException(status_code=400, detail="Missing required profile attributes.")
-
-    full_name = (name or " ".join(filter(None, [first_name, middle_name, last_name]))).strip()
+async def register_user(request: Request):
+    # Any uploaded file is ignored; Starlette spools and closes form files itself.
+    form = await request.form()
 
     try:
-        classification_payload = json.loads(classification) if classification else None
-    except json.JSONDecodeError:
-        classification_payload = classification
+        register_form = RegisterForm.from_form(form)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Missing required profile attributes.")
+
+    first_name = register_form.first_name
+    middle_name = register_form.middle_name
+    last_name = register_form.last_name
+    email = register_form.email
+    phone = register_form.phone
+    address_line1 = register_form.address_line1
+    address_line2 = register_form.address_line2
+    city = register_form.city
+    state = register_form.state
+    postal_code = register_form.postal_code
+    country = register_form.country
+    name = register_form.name
+    classification = register_form.classification
+    face_slug = register_form.face_slug
+    sample_count = register_form.sample_count
+
+    # RegisterForm.from_form already stripped every field and dropped blank ones.
+    full_name = name or " ".join(part for part in (first_name, middle_name, last_name) if part)
+
+    classification_payload = parse_classification(classification)
 
     profile = {
         "first_name": first_name,
@@ -95,7 +199,8 @@ async def register_user(
     }
 
     with LOCK:
-        users = load_users()
+        # Copy so a failed save never leaves the cached table holding this user.
+        users = dict(load_users())
         parsed_sample_count = None
         if sample_count and str(sample_count).isdigit():
             parsed_sample_count = int(sample_count)
@@ -113,17 +218,19 @@ async def register_user(
 
 @app.post("/verify-face")
 async def verify_face(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    if not image_bytes:
+    if not await file.read(1):
         raise HTTPException(status_code=400, detail="No image provided.")
+    await file.seek(0)
 
-    users = load_users()
+    # One snapshot keeps the table and its slug index on the same users.json version.
+    snapshot = users_snapshot()
+    users = snapshot.users
     if not users:
         return {"verified": False, "reason": "no_enrollments"}
 
     try:
-        clear_encodings_cache()
-        match = match_face(image_bytes)
+        # Detection and encoding are CPU-bound dlib calls; keep them off the event loop.
+        match = await run_in_threadpool(match_face, file.file)
     except FileNotFoundError:
         return {"verified": False, "reason": "encodings_missing"}
 
@@ -131,15 +238,14 @@ async def verify_face(file: UploadFile = File(...)):
         return {"verified": False, "reason": "no_match"}
 
     recognized_slug = match.get("name")
-    for email, record in users.items():
-        stored_slug = record.get("face_slug") or record.get("profile", {}).get("face_slug")
-        if stored_slug and stored_slug == recognized_slug:
-            return {
-                "verified": True,
-                "user": email,
-                "distance": match.get("distance"),
-                "profile": record.get("profile"),
-            }
+    email = snapshot.by_slug.get(recognized_slug)
+    if email is not None:
+        return {
+            "verified": True,
+            "user": email,
+            "distance": match.get("distance"),
+            "profile": users[email].get("profile"),
+        }
 
     return {
         "verified": False,
@@ -155,30 +261,7 @@ async def classifier_lookup(payload: Dict[str, Optional[str]] = Body(...)):
         raise HTTPException(status_code=400, detail="Classifier label is required.")
 
     label = label.strip()
-    users = load_users()
-    matches = []
-
-    for email, record in users.items():
-        profile = record.get("profile") or {}
-        classification = profile.get("classification")
-
-        classifier_label = None
-        probability = None
-        if isinstance(classification, dict):
-            classifier_label = classification.get("label")
-            probability = classification.get("probability")
-        elif isinstance(classification, str):
-            classifier_label = classification
-
-        if classifier_label and classifier_label.strip() == label:
-            matches.append(
-                {
-                    "email": email,
-                    "name": record.get("name"),
-                    "profile": profile,
-                    "probability": probability,
-                }
-            )
+    matches = list(users_snapshot().by_label.get(label.casefold(), ()))
 
     return {"label": label, "count": len(matches), "matches": matches}
 